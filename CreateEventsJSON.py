@@ -2,93 +2,224 @@
 """
 Wikipedia Article Data Collector
 Collects start/end dates and English pageviews for Hebrew Wikipedia articles
+
+Requires the packages in requirements.txt (pip install -r requirements.txt)
 """
 
-import json
-import requests
-import time
-from datetime import datetime
-from typing import Optional, Dict, List
+import argparse
+import asyncio
+import calendar
+from collections import defaultdict
+import copy
+from datetime import datetime, timedelta, timezone
+import logging
+import logging.handlers
+import queue
+import re
+from typing import Optional, Dict, List, Set, Union
+from urllib.parse import quote, urlsplit
 import sys
 
+import diskcache
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
+
+logger = logging.getLogger(__name__)
+
+# Canonical Wikidata time value: +YYYY-MM-DDT00:00:00Z
+_DATE_RE = re.compile(r'^\+(\d{4})-(\d{2})-(\d{2})T')
+
 class WikipediaCollector:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'WikipediaCollector/1.0 (Educational purposes)'
-        })
-    
-    def get_wikidata_id(self, hebrew_title: str) -> Optional[str]:
-        """Get Wikidata ID from Hebrew Wikipedia article title"""
-        url = "https://he.wikipedia.org/w/api.php"
+    # wbgetentities accepts at most 50 titles per request
+    BATCH_SIZE = 50
+    # Entities can still be edited, so cached copies are refreshed after 30 days
+    ENTITY_CACHE_TTL = 86400 * 30
+    # Date properties in order of precedence:
+    # start time / point in time / inception, end time / point in time / dissolved
+    _START_PROPS = ('P580', 'P585', 'P571')
+    _END_PROPS = ('P582', 'P585', 'P576')
+    _DATE_PROPS = _START_PROPS + _END_PROPS
+    # Date formatting by Wikidata precision (9 = year, 10 = month, 11 = day);
+    # anything else is formatted as a full date
+    _PRECISION_FMT = {
+        9: lambda p: f"{p[0]}-01-01",
+        10: lambda p: f"{p[0]}-{p[1]}-01",
+        11: lambda p: f"{p[0]}-{p[1]}-{p[2]}",
+    }
+    # Throttled or failing requests are retried with exponential backoff
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    MAX_ATTEMPTS = 5
+    MAX_BACKOFF = 30
+    # Pageview requests in flight across all batches; HTTP/2 multiplexes them
+    PAGEVIEW_CONCURRENCY = 50
+    # Pageview totals remembered within a run; the oldest are evicted past this size
+    PAGEVIEW_MEMO_SIZE = 10000
+    # Pageview data can still be revised for a few days after the fact
+    PAGEVIEW_SETTLE_DAYS = 3
+    # Monthly rows are published within this many days of the month closing
+    PAGEVIEW_MONTHLY_LAG_DAYS = 10
+    _PV_URL_TMPL = ('https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/en.wikipedia/'
+                    'all-access/all-agents/{title}/{granularity}/{start}/{end}')
+    
+    def __init__(self, concurrency: int = 20, rate: float = 10, period: float = 1,
+                 cache_dir: str = './.wpcache'):
+        self.concurrency = concurrency
+        self.cache = diskcache.Cache(cache_dir)
+        # HTTP/2 multiplexes concurrent requests to each host over one connection
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            timeout=10.0,
+            headers={'User-Agent': 'WikipediaCollector/1.0 (Educational purposes)'},
+            event_hooks={'response': [self._log_encoding]}
+        )
+        # One token bucket per host, so each API is throttled independently
+        self.limiters = defaultdict(lambda: AsyncLimiter(rate, period))
+        self.retry_locks = defaultdict(asyncio.Lock)
+        # In-run memo of pageview lookups, keyed by (underscored title, year):
+        # the task while in flight, then its total
+        self.pageview_memo: Dict[tuple, Union[asyncio.Task, int]] = {}
+        self.pageview_semaphore = asyncio.Semaphore(self.PAGEVIEW_CONCURRENCY)
+        # Pageviews date range per year (data starts mid-2015); the latest year ends yesterday
+        today = datetime.now(timezone.utc).date()
+        yesterday = today - timedelta(days=1)
+        self._pv_ranges = {
+            y: (f"{y}0101", yesterday.strftime('%Y%m%d') if y == yesterday.year else f"{y}1231")
+            for y in range(2015, yesterday.year + 1)
+        }
+        # Ranges ending before this date are final and can be cached for good
+        self._pv_settled = (today - timedelta(days=self.PAGEVIEW_SETTLE_DAYS)).strftime('%Y%m%d')
+        # Months ending on or after this date may not have a monthly row yet
+        self._pv_monthly_pending = (today - timedelta(days=self.PAGEVIEW_MONTHLY_LAG_DAYS)).strftime('%Y%m%d')
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        self.cache.close()
+    
+    async def _log_encoding(self, response: httpx.Response):
+        # httpx advertises every encoding it can decode; with the brotli extra from
+        # requirements.txt that is br as well as gzip and deflate
+        logger.debug("%s %s: Content-Encoding %s", response.request.method, response.request.url,
+                     response.headers.get('Content-Encoding', 'identity'))
+    
+    async def _get(self, host: str, url: str, params: Optional[Dict]) -> httpx.Response:
+        async with self.limiters[host]:
+            return await self.client.get(url, params=params)
+    
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before a retry: Retry-After if given, else exponential"""
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(int(retry_after), self.MAX_BACKOFF)
+        return min(2 ** (attempt - 1), self.MAX_BACKOFF)
+    
+    async def _get_json(self, url: str, params: Optional[Dict] = None) -> Dict:
+        """GET a URL and decode its JSON body, respecting the per-host rate limit"""
+        host = urlsplit(url).netloc
+        response = await self._get(host, url, params)
+        
+        if response.status_code in self.RETRY_STATUSES:
+            # Only one request per host backs off and retries at a time
+            async with self.retry_locks[host]:
+                for attempt in range(1, self.MAX_ATTEMPTS):
+                    delay = self._retry_delay(response, attempt)
+                    logger.warning("HTTP %s from %s, retrying in %ss", response.status_code, host, delay)
+                    await asyncio.sleep(delay)
+                    response = await self._get(host, url, params)
+                    if response.status_code not in self.RETRY_STATUSES:
+                        break
+        
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    async def get_wikidata_entities(self, hebrew_titles: List[str]) -> Optional[Dict[str, Dict]]:
+        """Get the Wikidata entities linked to up to BATCH_SIZE Hebrew Wikipedia article titles
+        
+        Returns None if the Wikidata request failed, as opposed to titles without an entity.
+        """
+        # Sitelink titles use spaces, input lines may use underscores
+        entities = {}
+        uncached = []
+        for hebrew_title in (title.replace('_', ' ') for title in hebrew_titles):
+            entity = self.cache.get(f'entity:{hebrew_title}')
+            if entity is None:
+                uncached.append(hebrew_title)
+            else:
+                entities[hebrew_title] = entity
+        
+        if not uncached:
+            return entities
+        
+        url = "https://www.wikidata.org/w/api.php"
         params = {
-            'action': 'query',
-            'titles': hebrew_title,
-            'prop': 'pageprops',
-            'format': 'json',
-            'ppprop': 'wikibase_item'
+            'action': 'wbgetentities',
+            'sites': 'hewiki',
+            'titles': '|'.join(uncached),
+            'props': 'claims|sitelinks',
+            # Only the sitelinks we read, instead of one per language edition
+            'sitefilter': 'hewiki|enwiki',
+            'format': 'json'
         }
         
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = await self._get_json(url, params=params)
             
-            pages = data.get('query', {}).get('pages', {})
-            for page_id, page_data in pages.items():
-                if page_id != '-1':  # Article exists
-                    return page_data.get('pageprops', {}).get('wikibase_item')
+            # Map each entity back to its article via the hewiki sitelink;
+            # titles without an entity come back keyed '-1', '-2', ... with 'missing'
+            for entity in data.get('entities', {}).values():
+                if 'missing' in entity:
+                    continue
+                hebrew_title = entity.get('sitelinks', {}).get('hewiki', {}).get('title')
+                if hebrew_title:
+                    entity = self._trim_entity(entity)
+                    entities[hebrew_title] = entity
+                    self.cache.set(f'entity:{hebrew_title}', entity, expire=self.ENTITY_CACHE_TTL)
         except Exception as e:
-            print(f"Error getting Wikidata ID for {hebrew_title}: {e}", file=sys.stderr)
+            logger.error("Error getting Wikidata entities for %d articles: %s", len(uncached), e)
+            return None
         
-        return None
+        return entities
+    
+    def _trim_entity(self, entity: Dict) -> Dict:
+        """Keep only the date claims and sitelinks we use, so cached entities stay small"""
+        claims = entity.get('claims', {})
+        return {
+            'id': entity.get('id'),
+            'claims': {prop: claims[prop] for prop in self._DATE_PROPS if prop in claims},
+            'sitelinks': entity.get('sitelinks', {})
+        }
     
-    def get_wikidata_info(self, wikidata_id: str) -> Dict:
-        """Get start date, end date, and English article title from Wikidata"""
-        url = f"https://www.wikidata.org/wiki/Special:EntityData/{wikidata_id}.json"
+    def get_wikidata_info(self, entity: Dict) -> Dict:
+        """Get start date, end date, and English article title from a Wikidata entity"""
+        claims = entity.get('claims', {})
+        sitelinks = entity.get('sitelinks', {})
         
-        try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            entity = data.get('entities', {}).get(wikidata_id, {})
-            claims = entity.get('claims', {})
-            sitelinks = entity.get('sitelinks', {})
-            
-            # Get English article title
-            english_title = sitelinks.get('enwiki', {}).get('title')
-            
-            # Get start date (P580 - start time)
-            start_date = self._extract_date(claims.get('P580', []))
-            
-            # Get end date (P582 - end time)
-            end_date = self._extract_date(claims.get('P582', []))
-            
-            # If no start/end time, try point in time (P585)
-            if not start_date and not end_date:
-                point_in_time = self._extract_date(claims.get('P585', []))
-                if point_in_time:
-                    start_date = point_in_time
-                    end_date = point_in_time
-            
-            # Try inception (P571) for start if still not found
-            if not start_date:
-                start_date = self._extract_date(claims.get('P571', []))
-            
-            # Try dissolution/abolished date (P576) for end if still not found
-            if not end_date:
-                end_date = self._extract_date(claims.get('P576', []))
-            
-            return {
-                'english_title': english_title,
-                'start_date': start_date,
-                'end_date': end_date
-            }
+        # Get English article title
+        english_title = sitelinks.get('enwiki', {}).get('title')
         
-        except Exception as e:
-            print(f"Error getting Wikidata info for {wikidata_id}: {e}", file=sys.stderr)
-            return {'english_title': None, 'start_date': None, 'end_date': None}
+        # P585 appears in both lists, so each property is extracted at most once
+        extracted = {}
+        start_date = self._first_date(claims, self._START_PROPS, extracted)
+        end_date = self._first_date(claims, self._END_PROPS, extracted)
+        
+        return {
+            'english_title': english_title,
+            'start_date': start_date,
+            'end_date': end_date
+        }
+    
+    def _first_date(self, claims: Dict, props: tuple, extracted: Dict) -> Optional[str]:
+        """Return the first date found among the given properties"""
+        for prop in props:
+            if prop not in extracted:
+                extracted[prop] = self._extract_date(claims.get(prop, []))
+            if extracted[prop]:
+                return extracted[prop]
+        return None
     
     def _extract_date(self, claims: List) -> Optional[str]:
         """Extract date from Wikidata claims"""
@@ -104,6 +235,11 @@ class WikipediaCollector:
                 time_str = date_value['time']
                 precision = date_value.get('precision', 11)  # 11 = day, 10 = month, 9 = year
                 
+                # Fast path for four-digit CE years
+                m = _DATE_RE.match(time_str)
+                if m:
+                    return self._PRECISION_FMT.get(precision, self._PRECISION_FMT[11])(m.groups())
+                
                 # Remove the leading + and timezone
                 time_str = time_str.lstrip('+').split('T')[0]
                 
@@ -118,128 +254,307 @@ class WikipediaCollector:
                     return time_str
         
         except Exception as e:
-            print(f"Error extracting date: {e}", file=sys.stderr)
+            logger.error("Error extracting date: %s", e)
         
         return None
     
-    def get_english_pageviews(self, english_title: str, year: int = 2025) -> int:
+    async def get_english_pageviews(self, english_title: str, year: int = 2025) -> int:
         """Get total pageviews for English Wikipedia article in a given year"""
-        # For 2025, we can only get data up to current date
-        current_date = datetime.now()
-        
-        if year == 2025:
-            # Get from Jan 1, 2025 to yesterday (or Jan 9, 2025 since today is Jan 10)
-            start_date = "20250101"
-            # Use yesterday's date
-            end_date = "20250109"
-        else:
-            start_date = f"{year}0101"
-            end_date = f"{year}1231"
+        # Articles sharing an English title share one lookup, even while it is in flight
+        key = (english_title.replace(' ', '_'), year)
+        memo = self.pageview_memo.get(key)
+        if isinstance(memo, int):
+            return memo
         
-        # Wikipedia Pageviews API
-        url = f"https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/en.wikipedia/all-access/all-agents/{english_title.replace(' ', '_')}/daily/{start_date}/{end_date}"
+        if memo is None:
+            memo = self.pageview_memo[key] = asyncio.ensure_future(self._fetch_english_pageviews(*key))
+            while len(self.pageview_memo) > self.PAGEVIEW_MEMO_SIZE:
+                del self.pageview_memo[next(iter(self.pageview_memo))]
+        
+        total_views = await memo
+        # Keep the total rather than the finished task, unless it was evicted meanwhile
+        if self.pageview_memo.get(key) is memo:
+            self.pageview_memo[key] = total_views
+        return total_views
+    
+    async def _fetch_english_pageviews(self, english_title: str, year: int) -> int:
+        if year not in self._pv_ranges:
+            logger.error("No pageviews data for %s in %d (available %d-%d)",
+                         english_title, year, min(self._pv_ranges), max(self._pv_ranges))
+            return 0
+        start_date, end_date = self._pv_ranges[year]
+        
+        cache_key = f"pageviews:{english_title}:{start_date}:{end_date}"
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Monthly totals only cover whole months, so a trailing partial month
+        # (the current one) is summed from daily data instead
+        end = datetime.strptime(end_date, '%Y%m%d')
+        if end.day == calendar.monthrange(end.year, end.month)[1]:
+            monthly_end, daily_start = end_date, None
+        else:
+            month_start = end.replace(day=1)
+            monthly_end = (month_start - timedelta(days=1)).strftime('%Y%m%d')
+            daily_start = max(start_date, month_start.strftime('%Y%m%d'))
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            items = []
+            if monthly_end >= start_date:
+                items = await self._pageview_items(english_title, 'monthly', start_date, monthly_end)
+                # A month's row is only published some time after it closes; until
+                # then a just-closed month is read from daily data too. Articles with
+                # no monthly data at all have none to wait for.
+                last_month = monthly_end[:6]
+                if (items and monthly_end >= self._pv_monthly_pending
+                        and not any(item.get('timestamp', '').startswith(last_month) for item in items)):
+                    daily_start = max(start_date, f"{last_month}01")
+            if daily_start:
+                items += await self._pageview_items(english_title, 'daily', daily_start, end_date)
+            
+            if not items:
+                logger.warning("Pageviews not found for %s", english_title)
+            total_views = sum(item.get('views', 0) for item in items)
             
-            total_views = sum(item.get('views', 0) for item in data.get('items', []))
+            # Settled ranges never change; recent ones are refreshed daily
+            expire = None if end_date < self._pv_settled else 86400
+            self.cache.set(cache_key, total_views, expire=expire)
             return total_views
         
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                print(f"Pageviews not found for {english_title}", file=sys.stderr)
-            else:
-                print(f"Error getting pageviews for {english_title}: {e}", file=sys.stderr)
-            return 0
         except Exception as e:
-            print(f"Error getting pageviews for {english_title}: {e}", file=sys.stderr)
+            logger.error("Error getting pageviews for %s: %s", english_title, e)
             return 0
     
-    def process_article(self, hebrew_title: str) -> Optional[Dict]:
-        """Process a single Hebrew Wikipedia article"""
-        print(f"Processing: {hebrew_title}", file=sys.stderr)
+    async def _pageview_items(self, english_title: str, granularity: str, start_date: str, end_date: str) -> List[Dict]:
+        """Get the Pageviews API items for a date range (none if the article has no data there)"""
+        url = self._PV_URL_TMPL.format(title=quote(english_title, safe=''), granularity=granularity,
+                                       start=start_date, end=end_date)
+        try:
+            data = await self._get_json(url)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return []
+            raise
+        return data.get('items', [])
+    
+    def get_article_info(self, hebrew_title: str, entity: Optional[Dict]) -> Optional[Dict]:
+        """Get dates and English title for a Hebrew Wikipedia article from its Wikidata entity"""
+        logger.info("Processing: %s", hebrew_title)
         
-        # Get Wikidata ID
-        wikidata_id = self.get_wikidata_id(hebrew_title)
-        if not wikidata_id:
-            print(f"  No Wikidata ID found for {hebrew_title}", file=sys.stderr)
+        if not entity:
+            logger.info("  No Wikidata ID found for %s", hebrew_title)
             return None
         
-        print(f"  Wikidata ID: {wikidata_id}", file=sys.stderr)
+        logger.info("  %s: Wikidata ID: %s", hebrew_title, entity.get('id'))
         
-        # Get info from Wikidata
-        info = self.get_wikidata_info(wikidata_id)
+        info = self.get_wikidata_info(entity)
         
         if not info['english_title']:
-            print(f"  No English article found for {hebrew_title}", file=sys.stderr)
+            logger.info("  No English article found for %s", hebrew_title)
             return None
         
-        print(f"  English title: {info['english_title']}", file=sys.stderr)
+        logger.info("  %s: English title: %s", hebrew_title, info['english_title'])
+        return info
+    
+    async def process_batch(self, hebrew_titles: List[str]) -> List[Optional[Dict]]:
+        """Process a batch of articles with a single Wikidata request"""
+        entities = await self.get_wikidata_entities(hebrew_titles)
+        if entities is None:
+            for title in hebrew_titles:
+                logger.error("  Could not fetch Wikidata entity for %s", title)
+            return [None] * len(hebrew_titles)
         
-        # Get pageviews
-        pageviews = self.get_english_pageviews(info['english_title'], 2025)
-        print(f"  Pageviews: {pageviews}", file=sys.stderr)
+        infos = [self.get_article_info(title, entities.get(title.replace('_', ' ')))
+                 for title in hebrew_titles]
         
-        result = {
-            'hebrew_article': hebrew_title,
-            'start_date': info['start_date'],
-            'end_date': info['end_date'],
-            'english_article': info['english_title'],
-            'english_pageviews_2025': pageviews
-        }
+        # Every English title is known now, so all pageview lookups go out together
+        async def bounded(english_title: str) -> int:
+            async with self.pageview_semaphore:
+                return await self.get_english_pageviews(english_title, 2025)
         
-        # Small delay to be respectful to APIs
-        time.sleep(0.5)
+        english_titles = dict.fromkeys(info['english_title'] for info in infos if info)
+        tasks = {english_title: asyncio.create_task(bounded(english_title)) for english_title in english_titles}
+        await asyncio.gather(*tasks.values())
         
-        return result
-    
-    def process_file(self, input_file: str, output_file: str = 'output.json'):
-        """Process all articles from input file"""
         results = []
+        for hebrew_title, info in zip(hebrew_titles, infos):
+            if not info:
+                results.append(None)
+                continue
+            result = {
+                'hebrew_article': hebrew_title,
+                'start_date': info['start_date'],
+                'end_date': info['end_date'],
+                'english_article': info['english_title'],
+                'english_pageviews_2025': tasks[info['english_title']].result()
+            }
+            logger.info("  %s: Pageviews: %s", hebrew_title, result['english_pageviews_2025'])
+            results.append(result)
+        return results
+    
+    def _parse_ndjson_record(self, line: bytes) -> Optional[Dict]:
+        """Decode one ndjson output line, or None if it is not a result record"""
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return None
+        if isinstance(record, dict) and 'hebrew_article' in record:
+            return record
+        return None
+    
+    def _resume_ndjson(self, output_file: str) -> Set[str]:
+        """Hebrew titles already written to an ndjson output file by an earlier run
+        
+        A run killed mid-write can leave a truncated last record; it is cut off so
+        that new records start on a line of their own. Raises ValueError if the file
+        holds anything else, such as output of a json-format run.
+        """
+        done = set()
+        try:
+            with open(output_file, 'r+b') as f:
+                complete = 0
+                fragment = b''
+                for number, line in enumerate(f, 1):
+                    if not line.endswith(b'\n'):
+                        fragment = line
+                        break
+                    record = self._parse_ndjson_record(line)
+                    if record is None:
+                        raise ValueError(f"line {number} of {output_file} is not an ndjson result record")
+                    done.add(record['hebrew_article'])
+                    complete += len(line)
+                
+                if fragment:
+                    record = self._parse_ndjson_record(fragment)
+                    if record is not None:
+                        # A whole record that only lacks its newline
+                        done.add(record['hebrew_article'])
+                        f.seek(0, 2)
+                        f.write(b'\n')
+                    elif fragment.startswith(b'{'):
+                        f.truncate(complete)
+                    else:
+                        raise ValueError(f"{output_file} does not end with an ndjson result record")
+        except FileNotFoundError:
+            pass
+        return done
+    
+    async def process_file(self, input_file: str, output_file: Optional[str] = None, output_format: str = 'json'):
+        """Process all articles from input file
+        
+        With output_format='ndjson' each result is appended to output_file as soon as
+        its batch finishes, and titles already in the file are skipped on re-runs.
+        output_file defaults to output.json or output.ndjson to match the format.
+        """
+        if output_file is None:
+            output_file = f"output.{output_format}"
         
         try:
             with open(input_file, 'r', encoding='utf-8') as f:
                 titles = [line.strip() for line in f if line.strip()]
         except FileNotFoundError:
-            print(f"Error: Input file '{input_file}' not found", file=sys.stderr)
+            logger.error("Error: Input file '%s' not found", input_file)
             return
         except Exception as e:
-            print(f"Error reading input file: {e}", file=sys.stderr)
+            logger.error("Error reading input file: %s", e)
             return
         
-        print(f"Found {len(titles)} articles to process\n", file=sys.stderr)
+        logger.info("Found %d articles to process", len(titles))
+        
+        if output_format == 'ndjson':
+            try:
+                done = self._resume_ndjson(output_file)
+            except ValueError as e:
+                logger.error("Error: cannot resume: %s", e)
+                return
+            remaining = [title for title in titles if title not in done]
+            if len(remaining) < len(titles):
+                logger.info("Skipping %d articles already in %s", len(titles) - len(remaining), output_file)
+            titles = remaining
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
         
-        for i, title in enumerate(titles, 1):
-            print(f"[{i}/{len(titles)}] ", file=sys.stderr, end='')
-            result = self.process_article(title)
-            if result:
-                results.append(result)
-            print('', file=sys.stderr)  # Empty line for readability
+        async def bounded(batch: List[str]) -> List[Dict]:
+            async with semaphore:
+                return [result for result in await self.process_batch(batch) if result]
+        
+        batches = [titles[i:i + self.BATCH_SIZE] for i in range(0, len(titles), self.BATCH_SIZE)]
+        
+        if output_format == 'ndjson':
+            # Only the count is kept per batch, so memory does not grow with the input
+            async def append(batch: List[str], out) -> int:
+                batch_results = await bounded(batch)
+                for result in batch_results:
+                    out.write(orjson.dumps(result) + b'\n')
+                out.flush()
+                return len(batch_results)
+            
+            try:
+                with open(output_file, 'ab') as out:
+                    saved = await asyncio.gather(*[append(batch, out) for batch in batches])
+                logger.info("Results saved to %s", output_file)
+                logger.info("Successfully processed %d/%d articles", sum(saved), len(titles))
+            except Exception as e:
+                logger.error("Error writing output file: %s", e)
+            return
+        
+        # Batches are fetched concurrently; gather keeps results in input order
+        processed = await asyncio.gather(*[bounded(batch) for batch in batches])
+        results = [result for batch in processed for result in batch]
         
         # Save results
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            print(f"\nResults saved to {output_file}", file=sys.stderr)
-            print(f"Successfully processed {len(results)}/{len(titles)} articles", file=sys.stderr)
+            # orjson emits UTF-8 without escaping, so Hebrew stays readable
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+            logger.info("Results saved to %s", output_file)
+            logger.info("Successfully processed %d/%d articles", len(results), len(titles))
         except Exception as e:
-            print(f"Error writing output file: {e}", file=sys.stderr)
+            logger.error("Error writing output file: %s", e)
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted, so message interpolation happens on the listener thread"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+async def run(input_file: str, output_file: Optional[str], output_format: str):
+    async with WikipediaCollector() as collector:
+        await collector.process_file(input_file, output_file, output_format)
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python wikipedia_collector.py <input_file> [output_file]")
-        print("\nExample:")
-        print("  python wikipedia_collector.py input.txt")
-        print("  python wikipedia_collector.py input.txt output.json")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else 'output.json'
-    
-    collector = WikipediaCollector()
-    collector.process_file(input_file, output_file)
+    parser = argparse.ArgumentParser(
+        description="Collect start/end dates and English pageviews for Hebrew Wikipedia articles",
+        epilog="Example:\n  python wikipedia_collector.py input.txt\n"
+               "  python wikipedia_collector.py input.txt output.ndjson --format=ndjson",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?',
+                        help="defaults to output.json, or output.ndjson with --format=ndjson")
+    parser.add_argument('--format', dest='output_format', choices=('json', 'ndjson'), default='json',
+                        help="ndjson appends results as they arrive and resumes interrupted runs")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="also log per-request details such as response Content-Encoding")
+    args = parser.parse_args()
+    
+    # Log records are queued by the event loop and written to stderr by a listener thread
+    log_queue = queue.SimpleQueue()
+    logging.basicConfig(level=logging.INFO, handlers=[_DeferredQueueHandler(log_queue)])
+    # httpx logs every request at INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    if args.verbose:
+        # Only this module's debug output; httpcore and h2 are far too chatty
+        logger.setLevel(logging.DEBUG)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stderr_handler)
+    listener.start()
+    try:
+        asyncio.run(run(args.input_file, args.output_file, args.output_format))
+    finally:
+        listener.stop()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()